@@ -0,0 +1,448 @@
+import asyncio
+import atexit
+import concurrent.futures
+import hashlib
+import logging
+import os
+import string
+import subprocess
+import tempfile
+import threading
+import time
+import pathlib
+import wave
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import ctcsound
+except (ImportError, OSError):  # Csound's Python bindings (and libcsound) are optional
+    ctcsound = None
+
+logger = logging.getLogger(__name__)
+
+# Rendered audio is cached on disk under the SHA-256 of its CSD source, so
+# re-rendering an identical patch never has to start csound again.
+_cache_dir = pathlib.Path(tempfile.gettempdir()) / "musmcp-cache"
+
+# Blocking render work (in-process Csound engines, NumPy synthesis) runs on a
+# worker pool that the tools await, so independent renders proceed in parallel.
+_pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# When ctcsound is available, each pool worker keeps a long-lived engine and
+# renders in-process instead of paying csound's process startup on every call.
+# A Csound instance is not reentrant, so engines are never shared across threads.
+_engines = threading.local()
+
+# Sample rate of audio synthesized directly in NumPy, matching the CSD templates
+SR = 44100
+
+# Every CSD shares the same header; each instrument's orchestra is baked into it
+# once at import (see csd_skeleton) so a render only formats its score line.
+_CSD_TEMPLATE = string.Template("""<CsoundSynthesizer>
+<CsOptions>
+</CsOptions>
+<CsInstruments>
+sr = 44100
+ksmps = 32
+nchnls = 1
+0dbfs = 1
+
+$orchestra
+</CsInstruments>
+<CsScore>
+$score
+</CsScore>
+</CsoundSynthesizer>""")
+
+def csd_skeleton(orchestra: str) -> string.Template:
+    """Bake `orchestra` into the CSD boilerplate, leaving only `$score` to fill in."""
+    return string.Template(_CSD_TEMPLATE.substitute(orchestra=orchestra, score="$score"))
+
+def offload(fn, *args):
+    """Run a blocking call on the render pool without blocking the event loop."""
+    return asyncio.wrap_future(_pool.submit(fn, *args))
+
+# Output files are resolved against the directory the server was started in;
+# looking it up once saves a getcwd() per render.
+_CWD = pathlib.Path.cwd()
+_WAV_SUFFIX = ".wav"
+
+def output_path(output_filename: str | None) -> str:
+    """Resolve the absolute .wav path for `output_filename`, or a fresh temp file."""
+    if output_filename:
+        # Ensure it ends with .wav
+        if not output_filename.endswith(_WAV_SUFFIX):
+            output_filename += _WAV_SUFFIX
+        return str(_CWD / output_filename)
+
+    fd, wav_path = tempfile.mkstemp(suffix=_WAV_SUFFIX)
+    os.close(fd)
+    _track(wav_path)
+    return wav_path
+
+def write_wav(wav_path: str, samples: np.ndarray) -> None:
+    """
+    Write mono float32 samples to a 16-bit PCM WAV file.
+    
+    Synthesis stays in float32 end to end; this is the only place samples are
+    quantized, saturating anything outside -1..1 instead of letting it wrap.
+    """
+    pcm = (np.clip(samples, -1.0, 1.0).astype(np.float32) * np.float32(32767)).astype("<i2")
+    with wave.open(wav_path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SR)
+        wav_file.writeframes(pcm.tobytes())
+
+class MemoryCacheBackend:
+    """
+    Bounded in-memory LRU cache in front of the on-disk render cache.
+    
+    Maps a CSD digest to the path of its cached .wav file, and optionally keeps
+    the file's bytes resident (up to `max_bytes`) so copies to a user-supplied
+    output file don't have to re-read the cache entry.
+    """
+
+    def __init__(self, max_size: int = 128, max_bytes: int = 16 * 1024 * 1024):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._paths: OrderedDict[str, str] = OrderedDict()
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+        self._data_size = 0
+
+    def get(self, key: str) -> str | None:
+        path = self._paths.get(key)
+        if path is not None:
+            self._paths.move_to_end(key)
+        return path
+
+    def put(self, key: str, path: str) -> None:
+        self._paths[key] = path
+        self._paths.move_to_end(key)
+        while len(self._paths) > self.max_size:
+            evicted, _ = self._paths.popitem(last=False)
+            self._drop_bytes(evicted)
+
+    def get_bytes(self, key: str) -> bytes | None:
+        data = self._data.get(key)
+        if data is not None:
+            self._data.move_to_end(key)
+        return data
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self._drop_bytes(key)
+        self._data[key] = data
+        self._data_size += len(data)
+        while self._data_size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._data_size -= len(evicted)
+
+    def discard(self, key: str) -> None:
+        self._paths.pop(key, None)
+        self._drop_bytes(key)
+
+    def _drop_bytes(self, key: str) -> None:
+        data = self._data.pop(key, None)
+        if data is not None:
+            self._data_size -= len(data)
+
+# One memory cache per category (usually the calling tool), so a burst of
+# kick drums can't evict every cached pad and vice versa.
+_memory_caches: dict[str, MemoryCacheBackend] = {}
+
+def _memory_cache(category: str) -> MemoryCacheBackend:
+    backend = _memory_caches.get(category)
+    if backend is None:
+        backend = _memory_caches[category] = MemoryCacheBackend()
+    return backend
+
+# Cache entries and temp outputs this process has handed out, least recently
+# used first. Past _MAX_GENERATED the oldest file is deleted, so a long-running
+# server keeps a bounded working set in the temp directory.
+_MAX_GENERATED = 256
+_generated: OrderedDict[str, None] = OrderedDict()
+
+# Cache files untouched for longer than this many seconds (default 8 hours) are
+# removed when the cache is trimmed; 0 keeps them indefinitely.
+_DEFAULT_CACHE_TTL = 8 * 60 * 60
+
+def _parse_cache_ttl(value: str | None) -> float:
+    """Parse MUSMCP_CACHE_TTL, falling back to the default if it isn't a number."""
+    if value is None:
+        return _DEFAULT_CACHE_TTL
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Ignoring invalid MUSMCP_CACHE_TTL=%r; using %d seconds", value, _DEFAULT_CACHE_TTL)
+        return _DEFAULT_CACHE_TTL
+
+_CACHE_TTL = _parse_cache_ttl(os.environ.get("MUSMCP_CACHE_TTL"))
+
+# Renders in progress in the cache directory, removed at exit if unfinished
+_pending: set[str] = set()
+
+def _discard(path: str) -> None:
+    """Delete a generated file and drop any memory cache entries pointing at it."""
+    pathlib.Path(path).unlink(missing_ok=True)
+    key = pathlib.Path(path).stem
+    for backend in _memory_caches.values():
+        backend.discard(key)
+
+def _track(path: str) -> None:
+    """Mark `path` as most recently used, evicting the oldest generated file if over budget."""
+    _generated[path] = None
+    _generated.move_to_end(path)
+    while len(_generated) > _MAX_GENERATED:
+        evicted, _ = _generated.popitem(last=False)
+        _discard(evicted)
+
+def _trim_cache_dir() -> None:
+    """Remove cache files (including abandoned partial renders) older than the TTL."""
+    if _CACHE_TTL <= 0:
+        return
+    cutoff = time.time() - _CACHE_TTL
+    try:
+        entries = list(os.scandir(_cache_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        # Never pull a partial render out from under this process's own render;
+        # other files (including other servers' .wav.tmp) must have aged past the TTL
+        if entry.path in _pending:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                _generated.pop(entry.path, None)
+                _discard(entry.path)
+        except FileNotFoundError:
+            pass
+
+@atexit.register
+def _cleanup() -> None:
+    """Delete temp outputs and unfinished renders; the render cache itself is kept."""
+    for path in list(_generated):
+        if pathlib.Path(path).parent != _cache_dir:
+            pathlib.Path(path).unlink(missing_ok=True)
+    for path in list(_pending):
+        pathlib.Path(path).unlink(missing_ok=True)
+
+def _engine():
+    """Return this thread's Csound engine, creating it on first use."""
+    cs = getattr(_engines, "cs", None)
+    if cs is None:
+        cs = _engines.cs = ctcsound.Csound()
+        cs.createMessageBuffer(False)
+    return cs
+
+def _render_with_ctcsound(csd_content: str, wav_path: str) -> str | None:
+    """Render on this thread's in-process engine. Returns an error message on failure."""
+    cs = _engine()
+    try:
+        # -o specifies the output file
+        # -W outputs WAV format
+        # -d suppresses UI/displays
+        cs.setOption(f"-o{wav_path}")
+        cs.setOption("-W")
+        cs.setOption("-d")
+        status = cs.compileCsdText(csd_content)
+        if status == 0:
+            status = cs.start()
+        if status == 0:
+            # perform() returns a negative value on a performance-time error,
+            # which leaves a truncated file that must not reach the cache
+            result = cs.perform()
+            if result < 0:
+                status = result
+    finally:
+        cs.reset()
+        messages = []
+        while cs.messageCnt() > 0:
+            messages.append(cs.firstMessage())
+            cs.popFirstMessage()
+
+    if status != 0:
+        return f"Error rendering CSD:\nMESSAGES:\n{''.join(messages)}"
+    return None
+
+async def _render_with_subprocess(csd_content: str, wav_path: str) -> str | None:
+    """Render by running the csound binary. Returns an error message on failure."""
+    # The csound CLI can't read a .csd from stdin, so the source is written next
+    # to the output (inside the cache dir, not loose in /tmp) and removed after
+    fd, csd_path = tempfile.mkstemp(suffix=".csd", dir=pathlib.Path(wav_path).parent)
+    _pending.add(csd_path)
+
+    try:
+        with os.fdopen(fd, "w") as csd_file:
+            csd_file.write(csd_content)
+
+        # Execute csound to render the file
+        # -o specifies the output file
+        # -W outputs WAV format
+        # -d suppresses UI/displays
+        cmd = ["csound", "-d", "-W", "-o", wav_path, csd_path]
+
+        # csound's console output is only useful when something went wrong, so the
+        # common case discards it rather than piping and decoding it
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        await proc.wait()
+
+        if proc.returncode != 0:
+            # Rendering is deterministic, so re-run with capture to report the failure
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
+            return f"Error rendering CSD:\nSTDOUT:\n{stdout.decode(errors='replace')}\nSTDERR:\n{stderr.decode(errors='replace')}"
+        return None
+    finally:
+        _pending.discard(csd_path)
+        pathlib.Path(csd_path).unlink(missing_ok=True)
+
+async def _render_uncached(csd_content: str, wav_path: str) -> str | None:
+    """Render `csd_content` to `wav_path`, preferring the in-process engine."""
+    if ctcsound is not None:
+        # Engine calls block, so they run on the worker pool
+        return await offload(_render_with_ctcsound, csd_content, wav_path)
+    # csound runs as a child process the event loop waits on without blocking
+    return await _render_with_subprocess(csd_content, wav_path)
+
+async def _render_to_cache(csd_content: str, cached: pathlib.Path) -> str | None:
+    """Render into the disk cache unless already present. Returns an error message on failure."""
+    try:
+        # Refresh the entry's mtime so the TTL only expires unused entries
+        os.utime(cached)
+        return None
+    except FileNotFoundError:
+        pass
+
+    _cache_dir.mkdir(parents=True, exist_ok=True)
+    _trim_cache_dir()
+
+    # Render next to the cache entry, then move it into place so a
+    # half-written file is never served as a cache hit
+    fd, tmp_path = tempfile.mkstemp(suffix=".wav.tmp", dir=_cache_dir)
+    os.close(fd)
+    _pending.add(tmp_path)
+
+    try:
+        error = await _render_uncached(csd_content, tmp_path)
+        if error is not None:
+            return error
+
+        os.replace(tmp_path, cached)
+        return None
+    finally:
+        _pending.discard(tmp_path)
+        pathlib.Path(tmp_path).unlink(missing_ok=True)
+
+# Cache misses currently being rendered, by digest, so concurrent requests for
+# the same CSD wait on one render instead of starting their own.
+_inflight: dict[str, asyncio.Future] = {}
+
+# Internal helper function, not exposed as a tool
+async def render_csd(csd_content: str, output_filename: str | None = None, category: str = "default") -> str:
+    """
+    Render a Csound (.csd) string to a WAV audio file.
+    
+    Identical CSD content is only rendered once; later calls are served from
+    the in-memory cache, then the on-disk cache, and copied to
+    `output_filename` if one is given. Rendering never blocks the event loop.
+    
+    Args:
+        csd_content: The complete Csound orchestra and score as a string.
+        output_filename: Optional name for the output file in the current directory.
+        category: Memory cache partition to use, typically the calling tool's name.
+        
+    Returns:
+        The absolute path to the generated .wav file.
+    """
+    try:
+        key = hashlib.sha256(csd_content.encode()).hexdigest()
+        memory = _memory_cache(category)
+        cached_path = memory.get(key)
+
+        if cached_path is not None:
+            # The file can disappear behind the memory cache (deleted by the client,
+            # /tmp cleanup, or another server trimming the shared cache dir), so make
+            # sure it still exists; touching it also keeps the TTL from expiring it
+            try:
+                os.utime(cached_path)
+            except FileNotFoundError:
+                memory.discard(key)
+                cached_path = None
+
+        if cached_path is None:
+            cached = _cache_dir / f"{key}.wav"
+
+            render = _inflight.get(key)
+            if render is None:
+                render = _inflight[key] = asyncio.ensure_future(_render_to_cache(csd_content, cached))
+                render.add_done_callback(lambda _: _inflight.pop(key, None))
+
+            # Shield the shared render so one cancelled caller doesn't cancel it for the others
+            error = await asyncio.shield(render)
+            if error is not None:
+                return error
+
+            cached_path = str(cached)
+            memory.put(key, cached_path)
+
+        _track(cached_path)
+
+        # Determine the .wav output path
+        if output_filename:
+            wav_path = output_path(output_filename)
+
+            data = memory.get_bytes(key)
+            if data is None:
+                data = await offload(pathlib.Path(cached_path).read_bytes)
+                memory.put_bytes(key, data)
+            await offload(pathlib.Path(wav_path).write_bytes, data)
+            return wav_path
+
+        return cached_path
+
+    except Exception as e:
+        return f"Failed to execute Csound: {str(e)}"
+
+def _render_tone(pitch: float, duration: float, wav_path: str) -> None:
+    """Compute a sine tone in NumPy and write it to `wav_path`."""
+    # Phase is computed in float64 and wrapped to one cycle before the float32
+    # sine, so long tones keep their precision (as the kick's oscillator does)
+    cycles = np.arange(int(SR * duration), dtype=np.float64) * (pitch / SR)
+    phase = np.float32(2 * np.pi) * (cycles % 1.0).astype(np.float32)
+    a = np.float32(0.5) * np.sin(phase)
+    write_wav(wav_path, a)
+
+# Internal helper function, not exposed as a tool
+async def synthesize_tone(pitch: float, duration: float, output_filename: str | None = None) -> str:
+    """
+    Generate a simple monophonic sine wave tone.
+    
+    A plain sine doesn't need Csound, so it is computed directly with NumPy.
+    
+    Args:
+        pitch: The frequency of the tone in Hz.
+        duration: The duration of the tone in seconds.
+        output_filename: Optional name for the output file.
+        
+    Returns:
+        The absolute path to the generated .wav file.
+    """
+    try:
+        wav_path = output_path(output_filename)
+        await offload(_render_tone, pitch, duration, wav_path)
+        return wav_path
+
+    except Exception as e:
+        return f"Failed to synthesize tone: {str(e)}"
+
+def clamp255(val: int) -> int:
+    """Clamp an integer parameter to the 0-255 range the tools accept."""
+    return max(0, min(255, val))
@@ -1,95 +1,57 @@
-import subprocess
-import tempfile
-import pathlib
+import os
 
+import numpy as np
 from mcp.server.fastmcp import FastMCP
 
+from .core import (
+    SR,
+    clamp255,
+    csd_skeleton,
+    offload,
+    output_path,
+    render_csd,
+    write_wav,
+)
+
 # Initialize FastMCP server
 mcp = FastMCP("Csound Controller")
 
-# Internal helper function, not exposed as a tool
-def render_csd(csd_content: str, output_filename: str | None = None) -> str:
-    """
-    Render a Csound (.csd) string to a WAV audio file.
-    
-    Args:
-        csd_content: The complete Csound orchestra and score as a string.
-        output_filename: Optional name for the output file in the current directory.
-        
-    Returns:
-        The absolute path to the generated .wav file.
-    """
-    try:
-        # Create a temporary file for the .csd input
-        with tempfile.NamedTemporaryFile(suffix=".csd", delete=False, mode="w") as csd_file:
-            csd_file.write(csd_content)
-            csd_path = csd_file.name
-            
-        # Determine the .wav output path
-        if output_filename:
-            # Ensure it ends with .wav
-            if not output_filename.endswith(".wav"):
-                output_filename += ".wav"
-            wav_path = str(pathlib.Path(output_filename).absolute())
-        else:
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file:
-                wav_path = wav_file.name
+# Kick drums are synthesized in NumPy by default; set MUSMCP_CSOUND_KICK=1 to
+# render them with the original Csound instrument instead.
+_CSOUND_KICK = os.environ.get("MUSMCP_CSOUND_KICK", "") not in ("", "0")
 
-        # Execute csound to render the file
-        # -o specifies the output file
-        # -W outputs WAV format
-        # -d suppresses UI/displays
-        cmd = ["csound", "-d", "-W", "-o", wav_path, csd_path]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return f"Error rendering CSD:\nSTDOUT:\n{result.stdout}\nSTDERR:\n{result.stderr}"
-            
-        return wav_path
+# The tools' 0-255 parameters map linearly onto fixed ranges; each mapping is
+# precomputed as an intercept (_B_*) and slope (_K_*) so a call is one multiply-add
+_INV255 = 1.0 / 255.0
+_B_ENV, _K_ENV = 0.001, (2.0 - 0.001) * _INV255                     # attack / decay seconds
+_B_SUS, _K_SUS = 0.0, (1.0 - 0.0) * _INV255                         # sustain level
+_B_REL, _K_REL = 0.001, (5.0 - 0.001) * _INV255                     # release seconds
+_B_KICK_DEC, _K_KICK_DEC = 0.1, (3.0 - 0.1) * _INV255               # kick decay seconds
+_B_PUNCH_PITCH, _K_PUNCH_PITCH = 100.0, (3000.0 - 100.0) * _INV255  # kick click, Hz above fundamental
+_B_PUNCH_DROP, _K_PUNCH_DROP = 0.1, (0.01 - 0.1) * _INV255          # kick pitch drop seconds
+_B_DRIVE, _K_DRIVE = 1.0, (20.0 - 1.0) * _INV255                    # kick saturation multiplier
 
-    except Exception as e:
-        return f"Failed to execute Csound: {str(e)}"
-
-# Internal helper function, not exposed as a tool
-def synthesize_tone(pitch: float, duration: float, output_filename: str | None = None) -> str:
-    """
-    Generate a simple monophonic sine wave tone.
+_SUBTRACTIVE_CSD = csd_skeleton("""instr 1
+    ; p4 = pitch, p5 = cutoff_hz, p6 = attack, p7 = decay, p8 = sustain, p9 = release
     
-    Args:
-        pitch: The frequency of the tone in Hz.
-        duration: The duration of the tone in seconds.
-        output_filename: Optional name for the output file.
-        
-    Returns:
-        The absolute path to the generated .wav file.
-    """
-    csd_template = f"""<CsoundSynthesizer>
-<CsOptions>
-</CsOptions>
-<CsInstruments>
-sr = 44100
-ksmps = 32
-nchnls = 1
-0dbfs = 1
-
-instr 1
-    a1 poscil 0.5, {pitch}
-    out a1
-endin
-</CsInstruments>
-<CsScore>
-i 1 0 {duration}
-</CsScore>
-</CsoundSynthesizer>"""
-    return render_csd(csd_template, output_filename)
-
-def map_0_255_to_range(val: int, min_val: float, max_val: float) -> float:
-    """Map an integer 0-255 linearly to a float range."""
-    return min_val + (max_val - min_val) * (val / 255.0)
+    ; 1. Amplitude ADSR 
+    ; madsr allows the note to release over time when it finishes
+    kamp madsr p6, p7, p8, p9
+    
+    ; 2. Oscillator - Sawtooth (vco2 mode 0 is saw)
+    asig vco2 1.0, p4, 0
+    
+    ; 3. Filter - Moog ladder lowpass
+    ; We add a slight envelope to the filter cutoff for more dynamic sound
+    kfilt_env expseg p5*3, p6+p7, p5
+    afil moogladder asig, kfilt_env, 0.4
+    
+    ; 4. Output (reduced master amplitude by 0.5 to leave headroom)
+    out (afil * kamp) * 0.5
+endin""")
 
 @mcp.tool()
-def synthesize_sawtooth_lead_bass(
+async def synthesize_sawtooth_lead_bass(
     pitch: float, 
     duration: float, 
     cutoff_hz: float, 
@@ -129,53 +91,23 @@ def synthesize_sawtooth_lead_bass(
         The absolute path to making the generated .wav file.
     """
     # Clamp inputs just in case
-    att = max(0, min(255, attack))
-    dec = max(0, min(255, decay))
-    sus = max(0, min(255, sustain))
-    rel = max(0, min(255, release))
+    att = clamp255(attack)
+    dec = clamp255(decay)
+    sus = clamp255(sustain)
+    rel = clamp255(release)
     
     # Map to real seconds/levels
-    att_sec = map_0_255_to_range(att, 0.001, 2.0)
-    dec_sec = map_0_255_to_range(dec, 0.001, 2.0)
-    sus_lvl = map_0_255_to_range(sus, 0.0, 1.0)
-    rel_sec = map_0_255_to_range(rel, 0.001, 5.0)
-    
-    # We must add release time to overall score duration so the tail isn't cut off
-    score_duration = duration + rel_sec
-    
-    csd = f"""<CsoundSynthesizer>
-<CsOptions>
-</CsOptions>
-<CsInstruments>
-sr = 44100
-ksmps = 32
-nchnls = 1
-0dbfs = 1
+    att_sec = _B_ENV + _K_ENV * att
+    dec_sec = _B_ENV + _K_ENV * dec
+    sus_lvl = _B_SUS + _K_SUS * sus
+    rel_sec = _B_REL + _K_REL * rel
 
-instr 1
-    ; 1. Amplitude ADSR 
-    ; madsr allows the note to release over time when it finishes
-    kamp madsr {att_sec}, {dec_sec}, {sus_lvl}, {rel_sec}
-    
-    ; 2. Oscillator - Sawtooth (vco2 mode 0 is saw)
-    asig vco2 1.0, {pitch}, 0
-    
-    ; 3. Filter - Moog ladder lowpass
-    ; We add a slight envelope to the filter cutoff for more dynamic sound
-    kfilt_env expseg {cutoff_hz}*3, {att_sec}+{dec_sec}, {cutoff_hz}
-    afil moogladder asig, kfilt_env, 0.4
-    
-    ; 4. Output (reduced master amplitude by 0.5 to leave headroom)
-    out (afil * kamp) * 0.5
-endin
-</CsInstruments>
-<CsScore>
-; Play instr 1, from start=0, for specified parameter duration.
-; The madsr opcode handles extending the note for the release phase.
-i 1 0 {duration}
-</CsScore>
-</CsoundSynthesizer>"""
-    return render_csd(csd, output_filename)
+    # Play instr 1, from start=0, for specified parameter duration.
+    # The madsr opcode handles extending the note for the release phase.
+    csd = _SUBTRACTIVE_CSD.substitute(
+        score=f"i 1 0 {duration} {pitch} {cutoff_hz} {att_sec} {dec_sec} {sus_lvl} {rel_sec}"
+    )
+    return await render_csd(csd, output_filename, category="subtractive")
 
 @mcp.resource("lore://sound_design")
 def get_sound_design_lore() -> str:
@@ -214,8 +146,65 @@ Parameters:
 - release: Low (20-50)
 """
 
+def _kick_pitch(t: np.ndarray, fundamental_hz: float, pitch_start: float, punch_drop_time: float) -> np.ndarray:
+    """Kick pitch in Hz at times `t`: an exponential drop to the fundamental, then hold."""
+    # Only the drop needs the power curve; the rest of the kick sits on the fundamental.
+    n_drop = min(len(t), int(np.ceil(SR * punch_drop_time)))
+    freq = np.full(len(t), fundamental_hz, dtype=np.float32)
+    freq[:n_drop] = np.float32(pitch_start) * np.float32(fundamental_hz / pitch_start) ** (t[:n_drop] / np.float32(punch_drop_time))
+    return freq
+
+def _render_kick(
+    fundamental_hz: float,
+    pitch_start: float,
+    punch_drop_time: float,
+    dec_sec: float,
+    drive_mult: float,
+    wav_path: str
+) -> None:
+    """Compute the kick drum voice in NumPy and write it to `wav_path`."""
+    t = np.arange(int(SR * dec_sec), dtype=np.float32) / SR
+    
+    # 1. Amplitude Envelope (exponential decay from 1.0 to 0.001)
+    amp = np.exp(t * np.float32(np.log(0.001) / dec_sec))
+    
+    # 2. Pitch Envelope (exponential drop to the fundamental, then hold, like expseg)
+    freq = _kick_pitch(t, fundamental_hz, pitch_start, punch_drop_time)
+    
+    # 3. Oscillator (Sine wave), integrating frequency into phase.
+    # The running sum is kept in float64 so long kicks don't drift out of tune,
+    # and starts from 0 so the sine starts at phase 0 like poscil.
+    cycles = np.concatenate(([0.0], np.cumsum(freq[:-1], dtype=np.float64))) / SR
+    phase = np.float32(2 * np.pi) * (cycles % 1.0).astype(np.float32)
+    asig = np.sin(phase) * amp
+    
+    # 4. Saturation/Drive (using tanh for soft clipping)
+    asig = np.tanh(asig * np.float32(drive_mult))
+    
+    # Normalize back down slightly if heavily driven
+    write_wav(wav_path, asig * np.float32(0.8))
+
+_KICK_CSD = csd_skeleton("""instr 1
+    ; p3 = decay time, p4 = fundamental_hz, p5 = pitch_start, p6 = punch_drop_time, p7 = drive_mult
+    
+    ; 1. Amplitude Envelope (exponential decay)
+    kamp expseg 1.0, p3, 0.001
+    
+    ; 2. Pitch Envelope (expseg holds p4 once the drop segment ends)
+    kpitch expseg p5, p6, p4
+    
+    ; 3. Oscillator (Sine wave)
+    asig poscil kamp, kpitch
+    
+    ; 4. Saturation/Drive (using tanh for soft clipping)
+    asig = tanh(asig * p7)
+    
+    ; Normalize back down slightly if heavily driven
+    out asig * 0.8
+endin""")
+
 @mcp.tool()
-def synthesize_kick_drum(
+async def synthesize_kick_drum(
     fundamental_hz: float,
     punch: int,
     decay: int,
@@ -244,52 +233,38 @@ def synthesize_kick_drum(
     Returns:
         The absolute path to the generated .wav file.
     """
-    pnc = max(0, min(255, punch))
-    dec = max(0, min(255, decay))
-    drv = max(0, min(255, drive))
+    # The pitch envelope is exponential, so it can't reach a non-positive frequency
+    if fundamental_hz <= 0:
+        return f"Failed to synthesize kick drum: fundamental_hz must be positive, got {fundamental_hz}"
+    
+    pnc = clamp255(punch)
+    dec = clamp255(decay)
+    drv = clamp255(drive)
     
     # Map decay (0-255) to 0.1 - 3.0 seconds
-    dec_sec = map_0_255_to_range(dec, 0.1, 3.0)
+    dec_sec = _B_KICK_DEC + _K_KICK_DEC * dec
     
     # Map punch to pitch envelope parameters
     # High punch = higher start pitch and faster drop
-    pitch_start = fundamental_hz + map_0_255_to_range(pnc, 100.0, 3000.0)
-    punch_drop_time = map_0_255_to_range(pnc, 0.1, 0.01) # higher punch = faster drop
+    pitch_start = fundamental_hz + _B_PUNCH_PITCH + _K_PUNCH_PITCH * pnc
+    punch_drop_time = _B_PUNCH_DROP + _K_PUNCH_DROP * pnc # higher punch = faster drop
     
     # Map drive to a multiplier for saturation
-    drive_mult = map_0_255_to_range(drv, 1.0, 20.0)
+    drive_mult = _B_DRIVE + _K_DRIVE * drv
     
-    csd = f"""<CsoundSynthesizer>
-<CsOptions>
-</CsOptions>
-<CsInstruments>
-sr = 44100
-ksmps = 32
-nchnls = 1
-0dbfs = 1
+    if not _CSOUND_KICK:
+        try:
+            wav_path = output_path(output_filename)
+            await offload(_render_kick, fundamental_hz, pitch_start, punch_drop_time, dec_sec, drive_mult, wav_path)
+            return wav_path
 
-instr 1
-    ; 1. Amplitude Envelope (exponential decay)
-    kamp expseg 1.0, {dec_sec}, 0.001
-    
-    ; 2. Pitch Envelope
-    kpitch expseg {pitch_start}, {punch_drop_time}, {fundamental_hz}, {dec_sec}, {fundamental_hz}
-    
-    ; 3. Oscillator (Sine wave)
-    asig poscil kamp, kpitch
+        except Exception as e:
+            return f"Failed to synthesize kick drum: {str(e)}"
     
-    ; 4. Saturation/Drive (using tanh for soft clipping)
-    asig = tanh(asig * {drive_mult})
-    
-    ; Normalize back down slightly if heavily driven
-    out asig * 0.8
-endin
-</CsInstruments>
-<CsScore>
-i 1 0 {dec_sec}
-</CsScore>
-</CsoundSynthesizer>"""
-    return render_csd(csd, output_filename)
+    csd = _KICK_CSD.substitute(
+        score=f"i 1 0 {dec_sec} {fundamental_hz} {pitch_start} {punch_drop_time} {drive_mult}"
+    )
+    return await render_csd(csd, output_filename, category="kick")
 
 @mcp.resource("lore://drum_design")
 def get_drum_design_lore() -> str:
@@ -0,0 +1,321 @@
+import asyncio
+import os
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from musmcp import core
+
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    """Isolate the render caches in `tmp_path` and replace Csound with a stub.
+
+    Returns the list of CSD strings the stub was asked to render.
+    """
+    calls = []
+
+    async def fake_render(csd_content, wav_path):
+        calls.append(csd_content)
+        if "FAIL" in csd_content:
+            return "Error rendering CSD:\nfake failure"
+        await asyncio.sleep(0.01)
+        with open(wav_path, "wb") as f:
+            f.write(csd_content.encode())
+        return None
+
+    monkeypatch.setattr(core, "_render_uncached", fake_render)
+    monkeypatch.setattr(core, "_cache_dir", tmp_path / "cache")
+    monkeypatch.setattr(core, "_CWD", tmp_path)
+    monkeypatch.setattr(core, "_memory_caches", {})
+    monkeypatch.setattr(core, "_generated", core.OrderedDict())
+    monkeypatch.setattr(core, "_inflight", {})
+    monkeypatch.setattr(core, "_pending", set())
+    return calls
+
+
+def test_memory_cache_evicts_least_recently_used_entry():
+    cache = core.MemoryCacheBackend(max_size=2)
+    cache.put("a", "a.wav")
+    cache.put("b", "b.wav")
+    cache.get("a")
+    cache.put("c", "c.wav")
+
+    assert cache.get("a") == "a.wav"
+    assert cache.get("b") is None
+    assert cache.get("c") == "c.wav"
+
+
+def test_memory_cache_enforces_byte_budget():
+    cache = core.MemoryCacheBackend(max_bytes=10)
+    cache.put_bytes("a", b"12345")
+    cache.put_bytes("b", b"1234")
+    cache.put_bytes("c", b"123")
+
+    assert cache.get_bytes("a") is None
+    assert cache.get_bytes("b") == b"1234"
+    assert cache.get_bytes("c") == b"123"
+    assert cache._data_size == 7
+
+    # Oversized payloads are never stored
+    cache.put_bytes("d", b"x" * 11)
+    assert cache.get_bytes("d") is None
+
+
+def test_memory_cache_evicting_a_path_drops_its_bytes():
+    cache = core.MemoryCacheBackend(max_size=1)
+    cache.put("a", "a.wav")
+    cache.put_bytes("a", b"data")
+    cache.put("b", "b.wav")
+
+    assert cache.get_bytes("a") is None
+    assert cache._data_size == 0
+
+
+def test_render_csd_serves_repeats_from_cache(renders):
+    first = asyncio.run(core.render_csd("tone"))
+    second = asyncio.run(core.render_csd("tone"))
+
+    assert first == second
+    assert os.path.exists(first)
+    assert renders == ["tone"]
+
+
+def test_render_csd_copies_to_output_filename(renders, tmp_path):
+    result = asyncio.run(core.render_csd("tone", "out"))
+
+    assert result == str(tmp_path / "out.wav")
+    assert (tmp_path / "out.wav").read_bytes() == b"tone"
+
+
+def test_render_csd_reports_render_errors(renders):
+    result = asyncio.run(core.render_csd("FAIL"))
+
+    assert result.startswith("Error rendering CSD")
+    assert not list(core._cache_dir.glob("*.tmp"))
+
+
+def test_render_csd_rerenders_deleted_cache_file(renders):
+    path = asyncio.run(core.render_csd("tone"))
+    os.unlink(path)
+
+    again = asyncio.run(core.render_csd("tone"))
+
+    assert again == path
+    assert os.path.exists(again)
+    assert renders == ["tone", "tone"]
+
+
+def test_render_csd_rerenders_deleted_cache_file_for_output_filename(renders, tmp_path):
+    asyncio.run(core.render_csd("tone", "first"))
+    cached_path = next(iter(core._generated))
+    os.unlink(cached_path)
+
+    result = asyncio.run(core.render_csd("tone", "second"))
+
+    assert result == str(tmp_path / "second.wav")
+    assert (tmp_path / "second.wav").read_bytes() == b"tone"
+    assert renders == ["tone", "tone"]
+
+
+def test_concurrent_identical_renders_share_one_render(renders):
+    async def burst():
+        return await asyncio.gather(*[core.render_csd("tone") for _ in range(5)], core.render_csd("pad"))
+
+    results = asyncio.run(burst())
+
+    assert len(set(results[:5])) == 1
+    assert sorted(renders) == ["pad", "tone"]
+    assert core._inflight == {}
+
+
+def test_generated_files_are_bounded(renders, monkeypatch):
+    monkeypatch.setattr(core, "_MAX_GENERATED", 2)
+
+    first, second, third = (asyncio.run(core.render_csd(csd)) for csd in "abc")
+
+    assert not os.path.exists(first)
+    assert list(core._generated) == [second, third]
+
+    # The evicted entry is dropped from memory too, so it renders again
+    asyncio.run(core.render_csd("a"))
+    assert renders == ["a", "b", "c", "a"]
+
+
+def test_trim_removes_expired_files_but_not_pending_renders(renders, monkeypatch):
+    monkeypatch.setattr(core, "_CACHE_TTL", 60)
+    fresh = asyncio.run(core.render_csd("fresh"))
+    stale = asyncio.run(core.render_csd("stale"))
+    abandoned = core._cache_dir / "abandoned.wav.tmp"
+    in_flight = core._cache_dir / "in_flight.wav.tmp"
+    for path in (stale, abandoned, in_flight):
+        open(path, "ab").close()
+        os.utime(path, (0, 0))
+    core._pending.add(str(in_flight))
+
+    core._trim_cache_dir()
+
+    assert os.path.exists(fresh)
+    assert not os.path.exists(stale)
+    assert not abandoned.exists()
+    assert in_flight.exists()
+
+    # The expired entry is forgotten by the memory cache and rendered again
+    asyncio.run(core.render_csd("stale"))
+    assert renders == ["fresh", "stale", "stale"]
+
+
+def test_memory_hits_refresh_ttl(renders, monkeypatch):
+    monkeypatch.setattr(core, "_CACHE_TTL", 60)
+    path = asyncio.run(core.render_csd("tone"))
+    os.utime(path, (0, 0))
+
+    asyncio.run(core.render_csd("tone"))
+    core._trim_cache_dir()
+
+    assert os.path.exists(path)
+
+
+def test_cleanup_removes_temp_outputs_but_keeps_cache(renders):
+    cached = asyncio.run(core.render_csd("tone"))
+    temp_output = core.output_path(None)
+
+    core._cleanup()
+
+    assert os.path.exists(cached)
+    assert not os.path.exists(temp_output)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, core._DEFAULT_CACHE_TTL), ("60", 60.0), ("0", 0.0), ("8h", core._DEFAULT_CACHE_TTL), ("", core._DEFAULT_CACHE_TTL)],
+)
+def test_parse_cache_ttl(value, expected):
+    assert core._parse_cache_ttl(value) == expected
+
+
+_SINE_CSD = core.csd_skeleton("""instr 1
+    out poscil(0.5, 440)
+endin""").substitute(score="i1 0 0.1")
+
+
+def test_subprocess_render_passes_csd_as_a_file(tmp_path, monkeypatch):
+    # A stand-in csound that copies its input file to the -o path
+    fake = tmp_path / "bin" / "csound"
+    fake.parent.mkdir()
+    fake.write_text('#!/bin/sh\nfor last; do :; done\ncp "$last" "$4"\n')
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", str(fake.parent), prepend=os.pathsep)
+    wav_path = tmp_path / "out.wav.tmp"
+
+    assert asyncio.run(core._render_with_subprocess("<CsoundSynthesizer/>", str(wav_path))) is None
+
+    assert wav_path.read_text() == "<CsoundSynthesizer/>"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bin", "out.wav.tmp"]
+    assert core._pending == set()
+
+
+@pytest.mark.skipif(shutil.which("csound") is None, reason="csound is not installed")
+def test_subprocess_render_with_csound(tmp_path):
+    wav_path = tmp_path / "out.wav.tmp"
+
+    assert asyncio.run(core._render_with_subprocess(_SINE_CSD, str(wav_path))) is None
+
+    with wave.open(str(wav_path)) as wav_file:
+        assert wav_file.getnchannels() == 1
+        assert wav_file.getframerate() == core.SR
+        assert wav_file.getnframes() == pytest.approx(core.SR * 0.1, abs=64)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.wav.tmp"]
+
+
+class _FakeCsound:
+    """Just enough of ctcsound.Csound to drive _render_with_ctcsound."""
+
+    def __init__(self, perform_result):
+        self.perform_result = perform_result
+        self.messages = ["perf error\n"] if perform_result < 0 else []
+
+    def setOption(self, option):
+        pass
+
+    def compileCsdText(self, csd):
+        return 0
+
+    def start(self):
+        return 0
+
+    def perform(self):
+        return self.perform_result
+
+    def reset(self):
+        pass
+
+    def messageCnt(self):
+        return len(self.messages)
+
+    def firstMessage(self):
+        return self.messages[0]
+
+    def popFirstMessage(self):
+        self.messages.pop(0)
+
+
+@pytest.mark.parametrize(("perform_result", "failed"), [(0, False), (1, False), (-1, True)])
+def test_ctcsound_render_reports_performance_errors(monkeypatch, perform_result, failed):
+    monkeypatch.setattr(core, "_engine", lambda: _FakeCsound(perform_result))
+
+    error = core._render_with_ctcsound("csd", "out.wav")
+
+    if failed:
+        assert error.startswith("Error rendering CSD") and "perf error" in error
+    else:
+        assert error is None
+
+
+def _read_wav(path):
+    with wave.open(str(path)) as wav_file:
+        params = wav_file.getparams()
+        samples = np.frombuffer(wav_file.readframes(params.nframes), dtype="<i2")
+    return params, samples
+
+
+def test_render_tone_writes_half_scale_sine(tmp_path):
+    wav_path = tmp_path / "tone.wav"
+
+    core._render_tone(440.0, 0.25, str(wav_path))
+
+    params, samples = _read_wav(wav_path)
+    assert params.nchannels == 1
+    assert params.framerate == core.SR
+    assert params.nframes == int(core.SR * 0.25)
+    assert np.abs(samples).max() == pytest.approx(0.5 * 32767, abs=1)
+
+
+def test_write_wav_saturates_instead_of_wrapping(tmp_path):
+    wav_path = tmp_path / "clip.wav"
+
+    core.write_wav(str(wav_path), np.array([2.0, -2.0, 0.5, 0.0], dtype=np.float32))
+
+    _, samples = _read_wav(wav_path)
+    assert samples.tolist() == [32767, -32767, 16383, 0]
+
+
+def test_output_path_resolves_names_against_startup_cwd(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "_CWD", tmp_path)
+
+    assert core.output_path("x") == str(tmp_path / "x.wav")
+    assert core.output_path("x.wav") == str(tmp_path / "x.wav")
+
+
+def test_output_path_tracks_temp_files(monkeypatch):
+    monkeypatch.setattr(core, "_generated", core.OrderedDict())
+
+    wav_path = core.output_path(None)
+    try:
+        assert wav_path.endswith(".wav")
+        assert os.path.exists(wav_path)
+        assert list(core._generated) == [wav_path]
+    finally:
+        os.unlink(wav_path)
@@ -0,0 +1,61 @@
+import asyncio
+import wave
+
+import numpy as np
+import pytest
+
+from musmcp import server
+
+
+def _read_wav(path):
+    with wave.open(str(path)) as wav_file:
+        params = wav_file.getparams()
+        samples = np.frombuffer(wav_file.readframes(params.nframes), dtype="<i2")
+    return params, samples
+
+
+def test_render_kick_writes_mono_wav_of_decay_length(tmp_path):
+    wav_path = tmp_path / "kick.wav"
+    dec_sec = 0.5
+
+    server._render_kick(50.0, 450.0, 0.05, dec_sec, 20.0, str(wav_path))
+
+    params, samples = _read_wav(wav_path)
+    assert params.nchannels == 1
+    assert params.framerate == server.SR
+    assert params.nframes == int(server.SR * dec_sec)
+    # Heavily driven, but the output is scaled to 0.8 of full scale
+    assert np.abs(samples).max() <= 0.8 * 32767
+    # The sine starts at phase 0, like poscil
+    assert samples[0] == 0
+
+
+@pytest.mark.parametrize("fundamental_hz", [0.0, -10.0])
+def test_kick_rejects_non_positive_fundamental(tmp_path, fundamental_hz):
+    result = asyncio.run(server.synthesize_kick_drum(fundamental_hz, 128, 128, 0, str(tmp_path / "kick")))
+
+    assert result.startswith("Failed to synthesize kick drum")
+    assert not (tmp_path / "kick.wav").exists()
+
+
+def test_kick_pitch_holds_fundamental_after_the_drop():
+    t = np.arange(int(server.SR * 0.5), dtype=np.float32) / server.SR
+    fundamental_hz, pitch_start, punch_drop_time = 50.0, 450.0, 0.05
+
+    freq = server._kick_pitch(t, fundamental_hz, pitch_start, punch_drop_time)
+
+    n_drop = int(np.ceil(server.SR * punch_drop_time))
+    assert freq.dtype == np.float32
+    assert np.all(freq[n_drop:] == np.float32(fundamental_hz))
+    # The specialized drop matches expseg's full power curve, clamped at the fundamental
+    full = pitch_start * (fundamental_hz / pitch_start) ** np.minimum(t / punch_drop_time, 1.0)
+    np.testing.assert_allclose(freq, full, rtol=1e-5)
+
+
+def test_kick_pitch_with_drop_longer_than_the_kick():
+    t = np.arange(100, dtype=np.float32) / server.SR
+
+    freq = server._kick_pitch(t, 50.0, 450.0, 1.0)
+
+    assert freq[0] == np.float32(450.0)
+    assert np.all(np.diff(freq) < 0)